@@ -1,6 +1,53 @@
-import struct
 import time
 
+try:
+    import micropython
+except ImportError:
+    # CPython: the code emitters are MicroPython-only, run the same functions as plain Python
+    class micropython:
+        @staticmethod
+        def native(func):
+            return func
+        viper = native
+
+    def ptr8(buf):
+        return buf
+
+
+def _crc8_table(polynomial):
+    # byte-wise lookup table for MSB-first CRC-8, built like Linux crc8_populate_msb()
+    table = bytearray(256)
+    t = 0x80
+    i = 1
+    while i < 256:
+        t = ((t << 1) ^ (polynomial if t & 0x80 else 0)) & 0xFF
+        for j in range(i):
+            table[i + j] = table[j] ^ t
+        i <<= 1
+    return bytes(table)
+
+_CRC8_TABLE = _crc8_table(0x31)  # P(x)=x^8+x^5+x^4+1
+# CRC is linear, so T[T[0xFF ^ hi] ^ lo] == T[T[0xFF ^ hi]] ^ T[lo]; precompute the
+# high byte's contribution (init value included) so both bytes are looked up independently
+_CRC8_TABLE_HI = bytes(_CRC8_TABLE[_CRC8_TABLE[0xFF ^ i]] for i in range(256))
+
+# temperature and humidity are computed in Q16.16 fixed point (libfixmath fix16_t style),
+# soft-float is expensive on the RP2040 Cortex-M0+
+def _q16_to_int(value):
+    # round half up to the nearest integer, like fix16_to_int()
+    return (value + 0x8000) >> 16
+
+def _q16_to_tenths(value):
+    # round to one decimal place
+    return ((value * 10 + 0x8000) >> 16) / 10
+
+# compiled to machine code by MicroPython, skipping bytecode dispatch
+@micropython.viper
+def _crc8_word(value: int) -> int:
+    lo = ptr8(_CRC8_TABLE)
+    hi = ptr8(_CRC8_TABLE_HI)
+    return hi[(value >> 8) & 0xFF] ^ lo[value & 0xFF]
+
 
 class HAIGU_DHT22:
     """Class to read temperature and humidity from DHT22 I2C HAIGU, much of class was
@@ -27,11 +74,19 @@ class HAIGU_DHT22:
     CMD_GET_HUMCOEFB_L  = 0xD20B # Read HumB lower 8 bits  
 
     MEASUREMENT_WAIT_TIME = 0.050  
+    MEASUREMENT_MIN_WAIT_MS = 5 # minimal wait after a trigger, _read polls for the rest
+    TEMPERATURE_TTL_MS = 5000 # temperature used for humidity compensation is reused this long
 
     def __init__(self, i2c, debug=False):
         self.debug = debug
         self._temperature = None
+        self._temperature_q16 = None
+        self._temperature_ts = 0
         self.i2c = i2c
+        self._wbuf = bytearray(2)  # reused command buffer for _write
+        # reused response buffers for _read, overwritten by the next read
+        self._rbuf3 = bytearray(3)
+        self._rbuf6 = bytearray(6)
         time.sleep(self.MEASUREMENT_WAIT_TIME)
         self.soft_reset()
         
@@ -40,6 +95,18 @@ class HAIGU_DHT22:
             self.humA, self.humB = self.get_humidity_coefficients()
             if self.humA is not None and self.humB is not None:
                 break
+
+        # fold the linear humidity transform into rh = _hum_c + value * _hum_k,
+        # including the -0.25 * 25.0 part of the temperature compensation;
+        # _hum_k gets as many fraction bits as keep value * _hum_k for any 16-bit
+        # value below 2**30, so it stays a MicroPython small int
+        delta = self.humA - self.humB
+        shift = 16
+        while abs((60 << (shift + 1)) // delta) * 0xFFFF < (1 << 30):
+            shift += 1
+        self._hum_k = (60 << shift) // delta
+        self._hum_shift = shift - 16  # from _hum_k's scale down to Q16.16
+        self._hum_c_q16 = (30 << 16) - ((self.humB * self._hum_k) >> self._hum_shift) - (25 << 14)
        
     def soft_reset(self):
         self._write(self.CMD_SOFT_RESET)
@@ -47,17 +114,21 @@ class HAIGU_DHT22:
     def _get_byte_with_crc_check(self, command):
         self._write(command)
         raw_bytes = self._read(3)
-        byte, dummy, crc_received = struct.unpack('<BBB', raw_bytes)
-        crc_computed = self._calculate_checksum(byte<<8|dummy)
+        if raw_bytes is None:
+            return None
+        byte = raw_bytes[0]
+        crc_computed = self._calculate_checksum(byte<<8|raw_bytes[1])
+        crc_received = raw_bytes[2]
         if crc_computed == crc_received:
             return byte
         return None
 
     def _get_coefficient(self, command):
         low = self._get_byte_with_crc_check(command)
+        if low is None:
+           return None
         high = self._get_byte_with_crc_check(command+1)
-
-        if low is None or high is None:            
+        if high is None:
            return None
         return low << 8|high
 
@@ -68,9 +139,14 @@ class HAIGU_DHT22:
 
     def get_temperature_and_humidity(self):
         self._write(self.CMD_MEASURE)
-        time.sleep(self.MEASUREMENT_WAIT_TIME)
+        time.sleep_ms(self.MEASUREMENT_MIN_WAIT_MS)
         data = self._read(6)
-        temp_data, temp_checksum, humidity_data, humidity_checksum = struct.unpack('>HBHB', data)
+        if data is None:
+            return None, None
+        temp_data = data[0] << 8 | data[1]
+        temp_checksum = data[2]
+        humidity_data = data[3] << 8 | data[4]
+        humidity_checksum = data[5]
         
         temp = None
         humi = None
@@ -82,7 +158,10 @@ class HAIGU_DHT22:
 
     def _read_integer_response(self):
         data = self._read(3)
-        raw_int, raw_checksum = struct.unpack('>HB', data)
+        if data is None:
+            return None
+        raw_int = data[0] << 8 | data[1]
+        raw_checksum = data[2]
         
         if self._calculate_checksum(raw_int) == raw_checksum:
            return raw_int
@@ -90,7 +169,7 @@ class HAIGU_DHT22:
 
     def get_temperature(self):    
         self._write(self.CMD_MEASURE_TEMPERATURE)
-        time.sleep(self.MEASUREMENT_WAIT_TIME)
+        time.sleep_ms(self.MEASUREMENT_MIN_WAIT_MS)
         value = self._read_integer_response()
         if value is None:
            return None 
@@ -99,33 +178,52 @@ class HAIGU_DHT22:
     
     def get_humidity(self):
         self._write(self.CMD_MEASURE_HUMIDITY)
-        time.sleep(self.MEASUREMENT_WAIT_TIME)
+        time.sleep_ms(self.MEASUREMENT_MIN_WAIT_MS)
         value = self._read_integer_response()
         if value is None:
            return None 
-        if self._temperature is None:
+        if self._temperature is None or time.ticks_diff(time.ticks_ms(), self._temperature_ts) > self.TEMPERATURE_TTL_MS:
            self.get_temperature()
+        if self._temperature is None:
+           return None
         return self._compute_humidity(value) 
 
     def _write(self, value):
-        self._debug_print(f"write 0x{self.I2C_ADDRESS:X}:", value)
-        self.i2c.writeto(self.I2C_ADDRESS, struct.pack(">H", value), False)
+        if self.debug:
+            self._debug_print(f"write 0x{self.I2C_ADDRESS:X}:", value)
+        self._wbuf[0] = (value >> 8) & 0xFF
+        self._wbuf[1] = value & 0xFF
+        self.i2c.writeto(self.I2C_ADDRESS, self._wbuf, False)
 
     def _read(self, count):
-        data = bytearray(count)
+        data = self._rbuf3 if count == 3 else self._rbuf6 if count == 6 else bytearray(count)
+        delay_us = 100
+        error = None
+        # give up after twice the worst-case measurement time
+        start = time.ticks_ms()
+        timeout_ms = int(self.MEASUREMENT_WAIT_TIME * 2000)
         while True:
             # While busy, the sensor doesn't respond to reads.
             try:
                 self.i2c.readfrom_into(self.I2C_ADDRESS, data)
-                self._debug_print(f"read 0x{self.I2C_ADDRESS:X}: ", data)
+                if self.debug:
+                    self._debug_print(f"read 0x{self.I2C_ADDRESS:X}: ", data)
                 if data[0] != 0xFF:  # Check if read succeeded.
                     break
-                time.sleep_ms(1)
             except OSError as e:
-                print (e)
-                pass      
+                # NACK while the measurement is still running
+                error = e
+                if self.debug:
+                    self._debug_print(str(e))
             except Exception as e:
+                error = e
                 print (e)
+            if time.ticks_diff(time.ticks_ms(), start) > timeout_ms:
+                print (f"read 0x{self.I2C_ADDRESS:X} timed out:", error)
+                return None
+            # back off exponentially, 100 us up to 2 ms between polls
+            time.sleep_us(delay_us)
+            delay_us = min(delay_us << 1, 2000)
         return data
 
     def __enter__(self):
@@ -134,40 +232,25 @@ class HAIGU_DHT22:
     def __exit__(self, *exc_info):
         return
 
-    def _calculate_checksum(self, value):
-        polynomial = 0x131  # //P(x)=x^8+x^5+x^4+1 = 100110001
-        crc = 0xFF
-        data = struct.pack(">H", value)
-        for byteCtr in range(len(data)):
-            crc ^= data[byteCtr]
-            for _ in range(8):
-                if crc & 0x80:
-                    crc = (crc << 1) ^ polynomial
-                else:
-                    crc = crc << 1
-                crc &= 0xFF  # Keep CRC to 8-bit
-
-        self._debug_print('Computed CRC', crc, 'for', value)
-        return crc
+    # CRC-8 of the two bytes of a 16-bit word, init 0xFF
+    _calculate_checksum = staticmethod(_crc8_word)
 
     def _compute_temperature(self, value):
-        # strip last 4 junky bits
+        # strip last 5 junky bits, then sign-extend the 16-bit two's complement value
         value &= 0xFFE0
-        if (value>0x7FF):
-            value -= 0xFFFE
+        if value & 0x8000:
+            value -= 0x10000
 
-        self._temperature = round(40.0 + value/256.0,1)
+        # raw LSB is 1/256 degC, i.e. value << 8 in Q16.16
+        self._temperature_q16 = (40 << 16) + (value << 8)
+        self._temperature = _q16_to_tenths(self._temperature_q16)
+        self._temperature_ts = time.ticks_ms()
         return self._temperature
     
+    @micropython.native
     def _compute_humidity(self, value, temperature = None):
-        rh = 30+(((value-self.humB)*60)/(self.humA-self.humB))
-        rel = rh + 0.25 * (self._temperature - 25.0)
-        if rel > 100.0:
-           rel = 100.0 
-        else:
-            if rel < 0.0:
-               rel = 0.0 
-        return int(round(rel,0))
+        rel_q16 = self._hum_c_q16 + ((value * self._hum_k) >> self._hum_shift) + (self._temperature_q16 >> 2)
+        return _q16_to_int(max(0, min(100 << 16, rel_q16)))
 
     def _debug_print(self, *args):
         if not self.debug:
@@ -193,13 +276,13 @@ class HAIGU_DHT22:
         # Print the formatted message
         print(" [DEBUG]", message)
 
-import machine
-import sys
 if __name__ == "__main__":
+    import machine
+
     try:
         # Adjust pins and frequency if needed
-        i2c = machine.I2C(1, scl=machine.Pin(11), sda=machine.Pin(10), freq=1000)  
-        #i2c = machine.SoftI2C(scl=machine.Pin(11), sda=machine.Pin(10), freq=1000)
+        i2c = machine.I2C(1, scl=machine.Pin(11), sda=machine.Pin(10), freq=100_000)  
+        #i2c = machine.SoftI2C(scl=machine.Pin(11), sda=machine.Pin(10), freq=100_000)
 
         print('i2c scanning ...')
         devices = i2c.scan()